@@ -32,6 +32,14 @@ def rate_limit_check(request: Request):
     Simple rate limiting to prevent API abuse
     Limits to RATE_LIMIT requests per minute per IP
     """
+    consume_rate_limit(request, 1)
+
+
+def consume_rate_limit(request: Request, count: int):
+    """
+    Count `count` requests against the caller's per-minute limit
+    Used directly by endpoints that do several requests' worth of work
+    """
     client_ip = request.client.host if request.client else "unknown"
     current_time = time.time()
 
@@ -48,7 +56,7 @@ def rate_limit_check(request: Request):
     if client_ip not in request_counts:
         request_counts[client_ip] = []
 
-    request_counts[client_ip].append(current_time)
+    request_counts[client_ip].extend([current_time] * count)
 
     if len(request_counts[client_ip]) > RATE_LIMIT:
         raise HTTPException(
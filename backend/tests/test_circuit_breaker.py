@@ -0,0 +1,90 @@
+"""Tests for the per-model circuit breaker."""
+import os
+import sys
+import unittest
+from unittest import mock
+
+# gemini_service configures the Gemini client at import time
+os.environ.setdefault("GEMINI_API_KEY", "test")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gemini_service  # noqa: E402
+from gemini_service import (  # noqa: E402
+    CB_FAILURE_THRESHOLD,
+    CB_OPEN_SECONDS,
+    _cb_allow,
+    _cb_record_failure,
+    _cb_record_success,
+)
+
+MODEL = "test-model"
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def setUp(self):
+        gemini_service._CB_STATE.clear()
+        self.addCleanup(gemini_service._CB_STATE.clear)
+        self.now = 1000.0
+        patcher = mock.patch.object(gemini_service.time, "time", side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def state(self):
+        return gemini_service.get_model_circuit_state()[MODEL]["state"]
+
+    def open_circuit(self):
+        for _ in range(CB_FAILURE_THRESHOLD):
+            self.assertTrue(_cb_allow(MODEL))
+            _cb_record_failure(MODEL, Exception("400 INVALID_ARGUMENT"))
+        self.assertEqual(self.state(), "open")
+        self.assertFalse(_cb_allow(MODEL))
+
+    def test_half_open_trial_success_closes(self):
+        self.open_circuit()
+        self.now += CB_OPEN_SECONDS
+
+        self.assertTrue(_cb_allow(MODEL))
+        self.assertEqual(self.state(), "half_open")
+        # Concurrent callers are held back while the trial is in flight
+        self.assertFalse(_cb_allow(MODEL))
+        self.assertFalse(_cb_allow(MODEL))
+
+        _cb_record_success(MODEL)
+        self.assertEqual(self.state(), "closed")
+        self.assertTrue(_cb_allow(MODEL))
+        self.assertTrue(_cb_allow(MODEL))
+
+    def test_half_open_trial_failure_reopens(self):
+        self.open_circuit()
+        self.now += CB_OPEN_SECONDS
+
+        self.assertTrue(_cb_allow(MODEL))
+        self.assertFalse(_cb_allow(MODEL))
+
+        _cb_record_failure(MODEL, Exception("400 INVALID_ARGUMENT"))
+        self.assertEqual(self.state(), "open")
+        self.assertFalse(_cb_allow(MODEL))
+
+        self.now += CB_OPEN_SECONDS
+        self.assertTrue(_cb_allow(MODEL))
+        self.assertEqual(self.state(), "half_open")
+
+    def test_abandoned_trial_is_retried(self):
+        self.open_circuit()
+        self.now += CB_OPEN_SECONDS
+        self.assertTrue(_cb_allow(MODEL))
+
+        self.now += CB_OPEN_SECONDS
+        self.assertTrue(_cb_allow(MODEL))
+        self.assertFalse(_cb_allow(MODEL))
+
+    def test_transient_errors_count_half(self):
+        for error in ("503 UNAVAILABLE", "Timeout while waiting", "Model overloaded"):
+            with self.subTest(error=error):
+                gemini_service._CB_STATE.clear()
+                _cb_record_failure(MODEL, Exception(error))
+                self.assertEqual(gemini_service.get_model_circuit_state()[MODEL]["fail_count"], 0.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
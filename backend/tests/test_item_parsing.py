@@ -0,0 +1,58 @@
+"""Regression tests for receipt item-line parsing."""
+import os
+import sys
+import unittest
+
+# gemini_service configures the Gemini client at import time
+os.environ.setdefault("GEMINI_API_KEY", "test")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gemini_service import _parse_item_line, categorize_item  # noqa: E402
+
+
+def parse(line):
+    return _parse_item_line(line, line.lower(), None)
+
+
+class QtyUnitTotalPatternTest(unittest.TestCase):
+    def test_trailing_tax_codes(self):
+        cases = [
+            ("1 Big Mac 5.99 5.99 A", "Big Mac", 1, 5.99, 5.99),
+            ("3 Apples 0.99 2.97 T", "Apples", 3, 0.99, 2.97),
+            ("2 Coke 1.99 3.98 F", "Coke", 2, 1.99, 3.98),
+        ]
+        for line, name, quantity, unit_price, price in cases:
+            with self.subTest(line=line):
+                item = parse(line)
+                self.assertIsNotNone(item)
+                self.assertEqual(item["name"], name)
+                self.assertEqual(item["quantity"], quantity)
+                self.assertEqual(item["unit_price"], unit_price)
+                self.assertEqual(item["price"], price)
+
+    def test_last_two_prices_are_unit_and_total(self):
+        item = parse("2 Item 1.00 5.99 11.98")
+        self.assertEqual(item["name"], "Item")
+        self.assertEqual(item["unit_price"], 5.99)
+        self.assertEqual(item["price"], 11.98)
+
+    def test_dollar_signs(self):
+        item = parse("2 Cable $4.99 $9.98")
+        self.assertEqual(item["name"], "Cable")
+        self.assertEqual(item["price"], 9.98)
+
+
+class CategorizeItemTest(unittest.TestCase):
+    def test_plural_keywords(self):
+        cases = [
+            ("Hot Dogs", "restaurant"),
+            ("hot dog", "restaurant"),
+            ("Apples", "groceries"),
+        ]
+        for name, category in cases:
+            with self.subTest(name=name):
+                self.assertEqual(categorize_item(name), category)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+"""Tests for the receipt extraction cache."""
+import os
+import sys
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+# gemini_service configures the Gemini client at import time
+os.environ.setdefault("GEMINI_API_KEY", "test")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gemini_service  # noqa: E402
+
+OCR_TEXT = "WALMART SUPERCENTER\nThank you for shopping with us"
+GEMINI_ITEMS = '{"merchant": "Walmart", "date": "2024-01-15", "items": [{"name": "Milk", "price": 3.49, "quantity": 1}], "total": 3.49}'
+GEMINI_NO_ITEMS = '{"merchant": "Walmart", "date": "2024-01-15", "items": []}'
+
+
+def gemini_response(text):
+    return SimpleNamespace(text=text)
+
+
+class ReceiptCacheTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        gemini_service._receipt_cache.clear()
+        patcher = mock.patch.dict(os.environ, {"FORCE_OCR": "false"})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(gemini_service._receipt_cache.clear)
+
+    async def test_real_results_are_cached(self):
+        with mock.patch.object(gemini_service, "extract_text_from_image", return_value=OCR_TEXT), \
+                mock.patch.object(gemini_service, "generate_with_model_rotation",
+                                  return_value=gemini_response(GEMINI_ITEMS)) as generate:
+            first = await gemini_service.extract_receipt_data(b"image")
+            second = await gemini_service.extract_receipt_data(b"image")
+
+        self.assertEqual(generate.call_count, 1)
+        self.assertEqual(first, second)
+
+    async def test_placeholder_items_are_not_cached(self):
+        with mock.patch.object(gemini_service, "extract_text_from_image", return_value=OCR_TEXT), \
+                mock.patch.object(gemini_service, "generate_with_model_rotation",
+                                  return_value=gemini_response(GEMINI_NO_ITEMS)) as generate:
+            first = await gemini_service.extract_receipt_data(b"image")
+            await gemini_service.extract_receipt_data(b"image")
+
+        self.assertTrue(first["_sample_data"])
+        self.assertEqual(generate.call_count, 2)
+
+    async def test_force_ocr_placeholder_items_are_not_cached(self):
+        with mock.patch.dict(os.environ, {"FORCE_OCR": "true"}), \
+                mock.patch.object(gemini_service, "extract_text_from_image", return_value=OCR_TEXT) as ocr:
+            first = await gemini_service.extract_receipt_data(b"image")
+            await gemini_service.extract_receipt_data(b"image")
+
+        self.assertTrue(first["_sample_data"])
+        self.assertEqual(ocr.call_count, 2)
+
+    async def test_batch_only_ocrs_uncached_images(self):
+        with mock.patch.object(gemini_service, "extract_text_from_image", return_value=OCR_TEXT), \
+                mock.patch.object(gemini_service, "generate_with_model_rotation",
+                                  return_value=gemini_response(GEMINI_ITEMS)):
+            await gemini_service.extract_receipt_data(b"cached")
+
+            with mock.patch.object(gemini_service, "extract_text_batch",
+                                   side_effect=lambda images: [OCR_TEXT] * len(images)) as batch:
+                results = await gemini_service.extract_receipts_data_batch([b"cached", b"new", b"new"])
+
+        batch.assert_called_once_with([b"new"])
+        self.assertEqual(len(results), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()